@@ -591,13 +591,14 @@ async function getProcessInsights() {
 
     const since24h = Math.floor(Date.now() / 1000) - 86400;
     const historicalAvg = await queryDb(`
-      SELECT name, 
-             AVG(cpu) as avg_cpu, 
-             AVG(ram_mb) as avg_ram,
+      SELECT p.name as name, 
+             AVG(m.cpu) as avg_cpu, 
+             AVG(m.ram_mb) as avg_ram,
              COUNT(*) as samples
-      FROM process_metrics 
-      WHERE timestamp > ${since24h}
-      GROUP BY name
+      FROM process_metrics m
+      JOIN processes p ON p.id = m.process_id
+      WHERE m.timestamp > ${since24h}
+      GROUP BY m.process_id
       HAVING samples > 5
     `);
 
@@ -4,17 +4,28 @@ Data collector - samples Glances API every 60s and stores in SQLite
 Also tracks OpenClaw token usage for 24hr stats
 """
 import sqlite3
-import urllib.request
+import http.client
 import subprocess
 import shutil
-import json
 import time
 from datetime import datetime
 from pathlib import Path
+from urllib.parse import urlsplit
+
+try:
+    from orjson import loads as _loads  # faster, and parses bytes directly
+except ImportError:
+    from json import loads as _loads
 
 DB_PATH = Path(__file__).parent / "history.db"
 GLANCES_API = "http://localhost:61208/api/4"
 INTERVAL = 60  # seconds
+# Each OpenClaw poll spawns a Node.js process, so keep it infrequent
+OPENCLAW_EVERY = 15  # cycles
+
+# Keep-alive connection to Glances, reused across fetches (opened lazily)
+GLANCES_URL = urlsplit(GLANCES_API)
+HTTP = None
 
 def find_openclaw():
     """Auto-detect openclaw binary path"""
@@ -42,10 +53,78 @@ def get_node_version():
         pass
     return "18.0.0"  # Fallback
 
-OPENCLAW_PATH = find_openclaw()
+# Detected on first OpenClaw poll (find_openclaw may shell out to node)
+_OPENCLAW_PATH = None
+_OPENCLAW_LOOKED = False
+_OC_ARGV = None  # status command, built once the path is known
 
-def init_db():
+def _openclaw():
+    """Return the openclaw binary path, detecting it once on first use"""
+    global _OPENCLAW_PATH, _OPENCLAW_LOOKED, _OC_ARGV
+    if not _OPENCLAW_LOOKED:
+        _OPENCLAW_PATH = find_openclaw()
+        _OPENCLAW_LOOKED = True
+        if _OPENCLAW_PATH:
+            _OC_ARGV = (str(_OPENCLAW_PATH), "status", "--json")
+            print(f"        🦞 OpenClaw found: {_OPENCLAW_PATH}")
+        else:
+            print("        🦞 OpenClaw not found (stats disabled)")
+    return _OPENCLAW_PATH
+
+# Long-lived SQLite connection shared by all writers (opened by init_db)
+CONN = None
+
+# Insert statements as fixed strings so the connection's statement cache
+# hands back the already-prepared statement on every call
+_SQL_METRIC = """
+    INSERT OR REPLACE INTO metrics 
+    (timestamp, cpu, ram, disk, load1, load5, load15, net_down, net_up)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_SQL_OPENCLAW = """
+    INSERT OR REPLACE INTO openclaw_stats 
+    (timestamp, sessions, tokens, status)
+    VALUES (?, ?, ?, ?)
+"""
+_SQL_PROC = """
+    INSERT INTO process_metrics (timestamp, process_id, cpu, ram_mb)
+    VALUES (?, ?, ?, ?)
+"""
+_SQL_PROC_NAME = "INSERT OR IGNORE INTO processes (name) VALUES (?)"
+_SQL_PROC_ID = "SELECT id FROM processes WHERE name = ?"
+
+# name -> processes.id, so known names never hit the lookup table
+_PROCESS_IDS = {}
+
+def connect_db():
+    """Open the history DB with per-connection tuning applied"""
     conn = sqlite3.connect(DB_PATH)
+    # In WAL mode NORMAL skips the fsync on commit and only syncs at checkpoint:
+    # a power loss can drop the last few commits, but the DB stays consistent
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=134217728")  # 128 MB
+    conn.execute("PRAGMA cache_size=-20000")  # ~20 MB
+    return conn
+
+def init_db():
+    global CONN
+    CONN = conn = connect_db()
+    # Let cleanup hand freed pages back to the OS in bounded steps. Only takes
+    # effect on an empty DB, so older history.db files are rebuilt once here.
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:  # 2 = INCREMENTAL
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    # Persists in the DB file; lets the API server read while we write
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Create/migrate the schema atomically
+    conn.execute("BEGIN")
+    # Older DBs stored the process name on every process_metrics row (and used
+    # AUTOINCREMENT ids); move that data into the normalized tables below
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(process_metrics)")}
+    legacy_procs = "name" in cols
+    if legacy_procs:
+        conn.execute("ALTER TABLE process_metrics RENAME TO process_metrics_old")
     conn.execute("""
         CREATE TABLE IF NOT EXISTS metrics (
             timestamp INTEGER PRIMARY KEY,
@@ -68,45 +147,94 @@ def init_db():
             status TEXT
         )
     """)
+    # Process names, stored once and referenced by id from process_metrics
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS processes (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE
+        )
+    """)
     # Process metrics table for historical tracking
     conn.execute("""
         CREATE TABLE IF NOT EXISTS process_metrics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER PRIMARY KEY,
             timestamp INTEGER,
-            name TEXT,
+            process_id INTEGER REFERENCES processes(id),
             cpu REAL,
             ram_mb REAL
         )
     """)
+    if legacy_procs:
+        conn.execute("""
+            INSERT OR IGNORE INTO processes (name)
+            SELECT DISTINCT name FROM process_metrics_old WHERE name IS NOT NULL
+        """)
+        conn.execute("""
+            INSERT INTO process_metrics (id, timestamp, process_id, cpu, ram_mb)
+            SELECT o.id, o.timestamp, p.id, o.cpu, o.ram_mb
+            FROM process_metrics_old o JOIN processes p ON p.name = o.name
+        """)
+        conn.execute("DROP TABLE process_metrics_old")  # takes its old indexes with it
     conn.execute("CREATE INDEX IF NOT EXISTS idx_ts ON metrics(timestamp)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_oc_ts ON openclaw_stats(timestamp)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_proc_ts ON process_metrics(timestamp)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_proc_name ON process_metrics(name)")
+    # (process_id, timestamp) serves per-process range lookups
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_proc_pid_ts ON process_metrics(process_id, timestamp)")
     conn.commit()
-    conn.close()
+    _PROCESS_IDS.clear()
+    _PROCESS_IDS.update((name, pid) for pid, name in conn.execute("SELECT id, name FROM processes"))
     print(f"📊 Database initialized: {DB_PATH}")
 
 def fetch_json(endpoint):
+    """GET a Glances endpoint over the shared keep-alive connection"""
+    global HTTP
+    path = f"{GLANCES_URL.path}/{endpoint}"
     try:
-        with urllib.request.urlopen(f"{GLANCES_API}/{endpoint}", timeout=5) as r:
-            return json.loads(r.read())
+        for _ in range(2):
+            reused = HTTP is not None
+            if not reused:
+                HTTP = http.client.HTTPConnection(GLANCES_URL.netloc, timeout=5)
+            try:
+                HTTP.request("GET", path)
+                r = HTTP.getresponse()
+                body = r.read()  # always drain so the socket can be reused
+                if r.status != 200:
+                    print(f"⚠️  Failed to fetch {endpoint}: HTTP {r.status}")
+                    return None
+                return _loads(body)
+            except (http.client.RemoteDisconnected, ConnectionError):
+                # Glances drops idle keep-alive sockets between cycles; reconnect once
+                HTTP.close()
+                HTTP = None
+                if not reused:
+                    raise
     except Exception as e:
+        if HTTP:
+            HTTP.close()
+            HTTP = None
         print(f"⚠️  Failed to fetch {endpoint}: {e}")
         return None
 
-def collect_sample():
-    cpu = fetch_json("cpu")
-    mem = fetch_json("mem")
-    disk = fetch_json("fs")
-    load = fetch_json("load")
-    net = fetch_json("network")
+def collect_sample(doc):
+    """Extract system metrics from a Glances /all document"""
+    if not doc:
+        return None
+    cpu = doc.get("cpu")
+    mem = doc.get("mem")
+    disk = doc.get("fs")
+    load = doc.get("load")
+    net = doc.get("network")
     
-    if not all([cpu, mem, disk, load, net]):
+    if None in (cpu, mem, disk, load, net):
         return None
     
-    # Calculate network totals
-    net_down = sum(i.get("bytes_recv_rate_per_sec", 0) for i in net if i.get("interface_name") != "lo")
-    net_up = sum(i.get("bytes_sent_rate_per_sec", 0) for i in net if i.get("interface_name") != "lo")
+    # Calculate network totals in one pass (rates can be null right after startup)
+    net_down = net_up = 0
+    for i in net:
+        if i.get("interface_name") == "lo":
+            continue
+        net_down += i.get("bytes_recv_rate_per_sec", 0) or 0
+        net_up += i.get("bytes_sent_rate_per_sec", 0) or 0
     
     # Get main disk
     main_disk = next((d for d in disk if d.get("mnt_point") == "/"), disk[0] if disk else {})
@@ -124,35 +252,25 @@ def collect_sample():
     }
 
 def save_sample(data):
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("""
-        INSERT OR REPLACE INTO metrics 
-        (timestamp, cpu, ram, disk, load1, load5, load15, net_down, net_up)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        data["timestamp"], data["cpu"], data["ram"], data["disk"],
-        data["load1"], data["load5"], data["load15"],
-        data["net_down"], data["net_up"]
-    ))
-    conn.commit()
-    conn.close()
+    with CONN:
+        CONN.execute(_SQL_METRIC, (
+            data["timestamp"], data["cpu"], data["ram"], data["disk"],
+            data["load1"], data["load5"], data["load15"],
+            data["net_down"], data["net_up"]
+        ))
 
 def collect_openclaw_stats():
     """Fetch OpenClaw status and return stats"""
-    if not OPENCLAW_PATH:
+    if not _openclaw():
         return None  # OpenClaw not installed
     
     try:
-        result = subprocess.run(
-            [str(OPENCLAW_PATH), "status", "--json"],
-            capture_output=True,
-            text=True,
-            timeout=15
-        )
+        # Bytes mode: the JSON parser takes the raw stdout, no text decoding layer
+        result = subprocess.run(_OC_ARGV, capture_output=True, timeout=15)
         if result.returncode != 0:
             return None
         
-        status = json.loads(result.stdout)
+        status = _loads(result.stdout)
         sessions = status.get("sessions", {})
         recent = sessions.get("recent", [])
         
@@ -170,18 +288,13 @@ def collect_openclaw_stats():
         return None
 
 def save_openclaw_stats(data):
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("""
-        INSERT OR REPLACE INTO openclaw_stats 
-        (timestamp, sessions, tokens, status)
-        VALUES (?, ?, ?, ?)
-    """, (data["timestamp"], data["sessions"], data["tokens"], data["status"]))
-    conn.commit()
-    conn.close()
+    with CONN:
+        CONN.execute(_SQL_OPENCLAW, (data["timestamp"], data["sessions"], data["tokens"], data["status"]))
 
-def collect_top_processes():
-    """Get top processes by CPU and RAM from Glances"""
-    procs = fetch_json("processlist")
+_MB = 1 << 20
+
+def collect_top_processes(procs):
+    """Get top processes by CPU and RAM from a Glances processlist"""
     if not procs:
         return []
     
@@ -207,9 +320,9 @@ def collect_top_processes():
         if mem_info:
             # memory_info can be a dict with 'rss' or a list
             if isinstance(mem_info, dict):
-                ram_mb = mem_info.get("rss", 0) / (1024 * 1024)
+                ram_mb = mem_info.get("rss", 0) / _MB
             elif isinstance(mem_info, (list, tuple)) and len(mem_info) > 0:
-                ram_mb = mem_info[0] / (1024 * 1024)
+                ram_mb = mem_info[0] / _MB
         
         top_procs.append({
             "name": name,
@@ -223,41 +336,59 @@ def collect_top_processes():
     return top_procs
 
 def save_process_metrics(timestamp, processes):
-    conn = sqlite3.connect(DB_PATH)
-    for p in processes:
-        conn.execute("""
-            INSERT INTO process_metrics (timestamp, name, cpu, ram_mb)
-            VALUES (?, ?, ?, ?)
-        """, (timestamp, p["name"], p["cpu"], p["ram_mb"]))
-    conn.commit()
-    conn.close()
+    # Ids for names seen for the first time; only cached once the insert commits
+    new_ids = {}
+    with CONN:
+        for p in processes:
+            name = p["name"]
+            if name not in _PROCESS_IDS and name not in new_ids:
+                CONN.execute(_SQL_PROC_NAME, (name,))
+                new_ids[name] = CONN.execute(_SQL_PROC_ID, (name,)).fetchone()[0]
+        CONN.executemany(_SQL_PROC, (
+            (timestamp, _PROCESS_IDS.get(p["name"]) or new_ids[p["name"]], p["cpu"], p["ram_mb"])
+            for p in processes
+        ))
+    _PROCESS_IDS.update(new_ids)
 
 def cleanup_old_data():
     """Keep only last 90 days of data (7 days for process metrics to save space)"""
-    cutoff_90d = int(time.time()) - (90 * 24 * 60 * 60)
-    cutoff_7d = int(time.time()) - (7 * 24 * 60 * 60)
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("DELETE FROM metrics WHERE timestamp < ?", (cutoff_90d,))
-    conn.execute("DELETE FROM openclaw_stats WHERE timestamp < ?", (cutoff_90d,))
-    conn.execute("DELETE FROM process_metrics WHERE timestamp < ?", (cutoff_7d,))
-    conn.commit()
-    conn.close()
+    now = int(time.time())  # one snapshot for both cutoffs
+    cutoff_90d = now - (90 * 24 * 60 * 60)
+    cutoff_7d = now - (7 * 24 * 60 * 60)
+    # Single transaction, so the WAL is flushed once for all the deletes
+    with CONN:
+        CONN.execute("DELETE FROM metrics WHERE timestamp < ?", (cutoff_90d,))
+        CONN.execute("DELETE FROM openclaw_stats WHERE timestamp < ?", (cutoff_90d,))
+        CONN.execute("DELETE FROM process_metrics WHERE timestamp < ?", (cutoff_7d,))
+        # Drop names no remaining sample refers to, so processes stays bounded too
+        stale = CONN.execute(
+            "SELECT name FROM processes WHERE id NOT IN (SELECT process_id FROM process_metrics)"
+        ).fetchall()
+        CONN.execute("DELETE FROM processes WHERE id NOT IN (SELECT process_id FROM process_metrics)")
+    for (name,) in stale:
+        _PROCESS_IDS.pop(name, None)
+    # Reclaim up to 1000 free pages; executescript steps the pragma to completion
+    # (a plain execute() would only free a single page)
+    CONN.executescript("PRAGMA incremental_vacuum(1000)")
 
 def main():
     print("🖥️  Mac Mini Metrics Collector")
     print(f"   Sampling every {INTERVAL}s")
     print(f"   Database: {DB_PATH}")
-    if OPENCLAW_PATH:
-        print(f"   OpenClaw: {OPENCLAW_PATH}")
-    else:
-        print("   OpenClaw: not found (stats disabled)")
+    print("   OpenClaw: detected on first poll")
     print()
     
     init_db()
     
     sample_count = 0
+    cycle = 0  # counts every loop, so schedules hold even when Glances is down
+    # Sleep until a fixed deadline so the cycle's own work doesn't add drift
+    next_tick = time.monotonic()
     while True:
-        data = collect_sample()
+        cycle += 1
+        # One request/parse per cycle: /all carries the metrics and the processlist
+        doc = fetch_json("all")
+        data = collect_sample(doc)
         if data:
             save_sample(data)
             sample_count += 1
@@ -265,23 +396,24 @@ def main():
             print(f"[{ts}] CPU: {data['cpu']:.1f}% | RAM: {data['ram']:.1f}% | Samples: {sample_count}")
             
             # Collect top processes every sample
-            procs = collect_top_processes()
+            procs = collect_top_processes(doc.get("processlist"))
             if procs:
                 save_process_metrics(data["timestamp"], procs)
                 print(f"        📊 Tracked {len(procs)} processes")
         
-        # Collect OpenClaw stats every 5 minutes (every 5 samples)
-        if sample_count > 0 and sample_count % 5 == 0:
+        # Collect OpenClaw stats every 15 minutes (every OPENCLAW_EVERY cycles)
+        if cycle % OPENCLAW_EVERY == 0:
             oc_data = collect_openclaw_stats()
             if oc_data:
                 save_openclaw_stats(oc_data)
                 print(f"        🦞 OpenClaw: {oc_data['sessions']} sessions, {oc_data['tokens']} tokens")
         
         # Cleanup old data every hour
-        if sample_count > 0 and sample_count % 60 == 0:
+        if cycle % 60 == 0:
             cleanup_old_data()
         
-        time.sleep(INTERVAL)
+        next_tick += INTERVAL
+        time.sleep(max(0.0, next_tick - time.monotonic()))
 
 if __name__ == "__main__":
     main()